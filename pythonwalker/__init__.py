@@ -35,3 +35,7 @@ from . import walker
 from .walker import *
 from . import walk
 from .walk import *
+from . import referents
+from .referents import *
+from . import referrers
+from .referrers import *
@@ -0,0 +1,241 @@
+"""Walking by referents for the Python walker.
+
+walk_object finds the children of an object by calling walker
+methods, each of which is a Python-level generator.  That is general
+but slow, and it can only find what the walker methods know about:
+the default one walks __dict__ and nothing else.
+
+This module finds children by asking the garbage collector instead:
+gc.get_referents returns everything an object refers to, and can be
+handed a whole frontier of objects at once, so a breadth-first walk
+costs one C call per level rather than a generator per object.  What
+it cannot tell you is the name a child has in its parent: there is a
+cheap, optional, name-recovery step for that, which is what
+named_referents does.
+
+named_referents obeys the walker method protocol, so it can be used
+with walk_object:
+
+ walk_object(thing, walkers=[named_referents])
+
+but it is *not* put on the fallback list.
+
+walk_referents is the bulk walker.
+"""
+
+import gc
+from types import (FunctionType, MethodType, GetSetDescriptorType,
+                   MemberDescriptorType, InstanceType, ClassType)
+from .walk import TooDeep
+
+__all__ = ['named_referents', 'walk_referents']
+
+# The types of some objects which commonly have referents other than
+# elements, and the attributes of their instances which hold them:
+# these are used to name referents which are not the elements of
+# dicts, lists or tuples.  They are read through the type's own
+# descriptors, so no user code (__getattr__, properties) is run.  This
+# list is not meant to be complete: referents it does not cover just
+# have no name.
+#
+CellType = type((lambda x: lambda: x)(None).__closure__[0])
+
+referent_attributes = ((FunctionType, ('__globals__', '__code__',
+                                       '__defaults__', '__closure__',
+                                       '__doc__', '__name__', '__module__')),
+                       (MethodType, ('__func__', '__self__', 'im_class')),
+                       (CellType, ('cell_contents',)),
+                       (type, ('__bases__', '__mro__', '__base__')))
+
+# Old-style instances and classes have no descriptors: these
+# attributes are special-cased by the types' own __getattribute__
+# before anything else is looked at, so reading them that way runs no
+# user code either.
+#
+old_style_attributes = ((InstanceType, ('__dict__', '__class__')),
+                        (ClassType, ('__dict__', '__bases__', '__name__')))
+
+# Read the __dict__ and __mro__ of a class without going near its
+# metaclass
+class_dict = type.__dict__['__dict__'].__get__
+class_mro = type.__dict__['__mro__'].__get__
+
+# The kinds of descriptor which make __dict__ without running user code
+standard_descriptors = (GetSetDescriptorType, MemberDescriptorType)
+
+# Types whose elements are named by named_referents and which have no
+# other referents worth naming
+element_types = frozenset((dict, list, tuple))
+
+def attribute_names(thing, where):
+    # Add entries to where, a dict, mapping the ids of the values of
+    # the attributes of thing which might be referents to their names.
+    # Attributes whose value is None are left out: None is everywhere,
+    # so matching it by identity just gives wrong names.  If a value
+    # already has an entry in where, which includes two attributes
+    # having the same value, the first one wins.
+    #
+    def note(v, a):
+        if v is not None and id(v) not in where:
+            where[id(v)] = a
+
+    # (issubclass of the type is used rather than isinstance, because
+    # isinstance looks at __class__, which may be a property)
+    cls = type(thing)
+    note(cls, '__class__')
+    for (t, attributes) in referent_attributes:
+        if issubclass(cls, t):
+            d = class_dict(t)
+            for a in attributes:
+                try:
+                    note(d[a].__get__(thing, t), a)
+                except (AttributeError, ValueError):
+                    # unset slots and empty cells
+                    pass
+    for (t, attributes) in old_style_attributes:
+        if issubclass(cls, t):
+            for a in attributes:
+                note(t.__getattribute__(thing, a), a)
+    if issubclass(cls, type):
+        # The __dict__ of a class is a proxy for the real dict, which
+        # is what gc.get_referents finds: the real one is the proxy's
+        # only referent.
+        for d in gc.get_referents(class_dict(thing)):
+            note(d, '__dict__')
+    else:
+        # Find the descriptor which makes __dict__ for instances of
+        # cls, and use it if it is a standard one (if it has been
+        # replaced by, say, a property, leave it alone).  On the way,
+        # name the values of any slots, which are member descriptors
+        # in the dicts of classes which define __slots__.
+        # (a few types which are not fully initialised have no mro)
+        found_dict = False
+        for c in class_mro(cls) or ():
+            d = class_dict(c)
+            if not found_dict:
+                descriptor = d.get('__dict__')
+                if descriptor is not None:
+                    found_dict = True
+                    if type(descriptor) in standard_descriptors:
+                        note(descriptor.__get__(thing, cls), '__dict__')
+            if '__slots__' in d:
+                for (a, descriptor) in d.iteritems():
+                    if type(descriptor) is MemberDescriptorType:
+                        try:
+                            note(descriptor.__get__(thing, cls), a)
+                        except AttributeError:
+                            # unset slot
+                            pass
+    return where
+
+def named_referents(thing, names=True):
+    # Return a list of (name, referent) tuples for thing, or None if
+    # it has no referents.  If names is false, or a name can't be
+    # found for a referent, the name is None.
+    #
+    # Names are recovered by matching the referents against the
+    # obvious places they might have come from, by identity.  For
+    # dicts the name of a value is its key, for lists and tuples it is
+    # the index, and for anything else, including instances of
+    # subclasses of those, it is (also) an attribute name found by
+    # attribute_names.  Elements are read through the base type's own
+    # methods, so overriding iteritems or __iter__ makes no difference.
+    #
+    # Matching is by identity, so an object has only one name in
+    # thing: the first one found, with dict keys coming before their
+    # values, elements before attributes.  Keys themselves have no
+    # name, so an object which is both a key and a value has no name
+    # at all.  If an object turns up more than once in thing then it
+    # turns up as many times in the result as gc.get_referents
+    # reports it, each time with that same name.
+    #
+    referents = gc.get_referents(thing)
+    if not referents:
+        return None
+    if not names:
+        return [(None, r) for r in referents]
+    where = {}
+    cls = type(thing)
+    if issubclass(cls, dict):
+        for (k, v) in dict.iteritems(thing):
+            where.setdefault(id(k), None)
+            where.setdefault(id(v), k)
+    elif issubclass(cls, list):
+        for (i, v) in enumerate(list.__iter__(thing)):
+            where.setdefault(id(v), i)
+    elif issubclass(cls, tuple):
+        for (i, v) in enumerate(tuple.__iter__(thing)):
+            where.setdefault(id(v), i)
+    if cls not in element_types:
+        attribute_names(thing, where)
+    return [(where.get(id(r)), r) for r in referents]
+
+def walk_referents(roots, visitor=lambda o, p, n: None,
+                   identity=id, seen=None, maxdepth=100, names=False):
+    # Walk everything reachable from roots, breadth-first.
+    #
+    # roots is an iterable of (name, object) tuples, such as you get
+    # from sys.modules.iteritems(): roots which are None (or otherwise
+    # false) are skipped, as walk_modules does.  Each object reachable
+    # from one of the roots which has not been seen already is visited
+    # exactly once, by calling visitor on it, its parent and its name
+    # in the parent.  Roots have None as their parent and the name
+    # they came with.  The value of visitor is ignored, and so is the
+    # order of the roots: they are all the first level of the walk.
+    #
+    # If names is false, which is the default, each level of the walk
+    # is fetched with a single call to gc.get_referents, which is what
+    # makes this fast, but the parent and name given to the visitor
+    # are None for everything but the roots.  If names is true then
+    # each object's referents are fetched with named_referents, and
+    # the visitor is told the parent and (if it can be found) the name
+    # of each object.  This is a lot slower, but still cheaper than
+    # walk_object.
+    #
+    # identity and seen are as for walk_object, and, as there, seen is
+    # mutated, so several walks can share one.
+    #
+    # maxdepth is the number of levels to go down before raising a
+    # TooDeep exception.  Note that a breadth-first walk of referents
+    # goes places walk_object does not (classes, code objects and so
+    # on), so the number of levels can be larger than you expect.
+    #
+    # Unlike walk_object, this is a pre-order walk and there is no
+    # data to combine: objects are visited before their children, and
+    # objects which have been seen already are not visited again.
+    #
+    if seen is None:
+        seen = set()
+
+    frontier = []
+    for (name, root) in roots:
+        if not root:
+            continue
+        hashable = identity(root)
+        if hashable not in seen:
+            seen.add(hashable)
+            visitor(root, None, name)
+            frontier.append(root)
+
+    depth = 0
+    while frontier:
+        if depth >= maxdepth:
+            raise TooDeep("too deep", depth)
+        depth += 1
+        following = []
+        if names:
+            for parent in frontier:
+                for (name, child) in named_referents(parent) or ():
+                    hashable = identity(child)
+                    if hashable not in seen:
+                        seen.add(hashable)
+                        visitor(child, parent, name)
+                        following.append(child)
+        else:
+            for child in gc.get_referents(*frontier):
+                hashable = identity(child)
+                if hashable not in seen:
+                    seen.add(hashable)
+                    visitor(child, None, None)
+                    following.append(child)
+        frontier = following
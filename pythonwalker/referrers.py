@@ -0,0 +1,203 @@
+"""Referrer indices for the Python walker.
+
+walk_object and walk_referents tell the visitor about an object's
+parent and then forget it.  That makes it hard to answer the question
+you usually have once you have found some suspicious object: why is
+it still alive, and which module is holding on to it?
+
+index_referrers walks sys.modules (or something like it) once and
+builds a ReferrerIndex, which records every edge it found backwards,
+from child to parents.  Objects become small integer node ids, edge
+names are interned, and the edges are stored in compressed sparse row
+form: for node i, its referrers are the entries of the parent and name
+arrays between offsets[i] and offsets[i + 1].  The index then answers
+questions without walking anything again:
+
+ index = index_referrers()
+ index.referrers(thing)         # [(parent, name), ...]
+ index.retention_path(thing)    # [(module name, module), ...,
+                                #  (name, thing)]
+
+Note that the index refers to every object it has seen, so it keeps
+them all alive: drop it when you are done with it.
+"""
+
+import sys
+from array import array
+from collections import deque
+from .low import Bug
+from .referents import named_referents
+
+__all__ = ['ReferrerIndex', 'index_referrers']
+
+# The types of edge names which index_referrers interns by value
+interned_name_types = frozenset((str, unicode, int, long, bool,
+                                 type(None)))
+
+class ReferrerIndex(object):
+    """A reverse-edge index of a set of objects.
+
+    Make one with index_referrers rather than directly.
+    """
+
+    def __init__(self, nodes, node_ids, root_names,
+                 offsets, parents, names, name_table):
+        # nodes is a list of objects, whose index is their node id,
+        # with the roots first, and node_ids maps from the id of an
+        # object to its node id.  root_names are the names of the
+        # roots.  offsets, parents and names are the CSR arrays
+        # described above, with names being indices into name_table.
+        self.nodes = nodes
+        self.node_ids = node_ids
+        self.root_names = root_names
+        self.offsets = offsets
+        self.parents = parents
+        self.names = names
+        self.name_table = name_table
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, thing):
+        return id(thing) in self.node_ids
+
+    def referrers(self, thing):
+        # Return a list of (parent, name) tuples for the objects which
+        # refer to thing, or None if thing is not in the index.
+        #
+        node = self.node_ids.get(id(thing))
+        if node is None:
+            return None
+        (nodes, parents, names, name_table) = (self.nodes, self.parents,
+                                               self.names, self.name_table)
+        return [(nodes[parents[k]], name_table[names[k]])
+                for k in xrange(self.offsets[node], self.offsets[node + 1])]
+
+    def retention_path(self, thing):
+        # Return the shortest path from a root to thing, as a list of
+        # (name, object) tuples: the first is the root with its name,
+        # and each of the others is an object with its name in the
+        # previous one, ending with thing.  If thing is a root the path
+        # has one element.  If thing is not in the index return None.
+        #
+        # This is a breadth-first search backwards along the referrer
+        # edges from thing, which stops at the first root it reaches.
+        #
+        node = self.node_ids.get(id(thing))
+        if node is None:
+            return None
+        (offsets, parents, names) = (self.offsets, self.parents, self.names)
+        nroots = len(self.root_names)
+        # towards maps a node to the (node, name) it is a referrer of
+        # on the way to thing: this is both the seen set and how the
+        # path is read off
+        towards = {node: None}
+        queue = deque((node,))
+        while queue:
+            child = queue.popleft()
+            if child < nroots:
+                # roots are the first nodes, so this is a root
+                path = [(self.root_names[child], self.nodes[child])]
+                while towards[child] is not None:
+                    (child, name) = towards[child]
+                    path.append((self.name_table[name], self.nodes[child]))
+                return path
+            for k in xrange(offsets[child], offsets[child + 1]):
+                parent = parents[k]
+                if parent not in towards:
+                    towards[parent] = (child, names[k])
+                    queue.append(parent)
+        # Every node was reached from a root, so this should not happen
+        raise Bug("no retention path for node {}".format(node))
+
+def index_referrers(modules=sys.modules, check=True):
+    # Walk modules, which should look like sys.modules, once and
+    # return a ReferrerIndex of everything reachable from the modules
+    # in it.  Entries which are None are skipped.
+    #
+    # The walk is breadth-first, using named_referents, and records
+    # every edge, not just the first edge by which it reached an
+    # object, so the index knows all of an object's referrers that
+    # are reachable from modules.
+    #
+    # Names are interned by type as well as value, since names which
+    # are equal are not always the same name: the list index 1, and
+    # the dict keys 1.0 and True, are all equal.  Only names of the
+    # types in interned_name_types are interned by value, since for
+    # them equality is safe and means what it should: anything else
+    # could be a dict key with its own __hash__ and __eq__, which might
+    # raise, or claim to be equal to everything, so it is interned by
+    # identity (name_table keeps it alive, so its id stays good).
+    #
+    # If check is true, sanity check the CSR arrays before returning.
+    #
+    nodes = []                  # node id -> object
+    node_ids = {}               # id(object) -> node id
+    root_names = []             # names of the roots
+    name_table = []             # name id -> name
+    name_ids = {}               # (type, name) -> name id
+    name_ids_by_id = {}         # id(name) -> name id
+    children = array('l')       # the edges, as three columns
+    parents = array('l')
+    names = array('l')
+
+    for (name, mod) in modules.iteritems():
+        if mod and id(mod) not in node_ids:
+            node_ids[id(mod)] = len(nodes)
+            nodes.append(mod)
+            root_names.append(name)
+
+    # nodes is the queue for the walk: it grows as it is walked
+    parent = 0
+    while parent < len(nodes):
+        for (name, child) in named_referents(nodes[parent]) or ():
+            c = node_ids.get(id(child))
+            if c is None:
+                c = node_ids[id(child)] = len(nodes)
+                nodes.append(child)
+            if type(name) in interned_name_types:
+                (ids, key) = (name_ids, (type(name), name))
+            else:
+                (ids, key) = (name_ids_by_id, id(name))
+            n = ids.get(key)
+            if n is None:
+                n = ids[key] = len(name_table)
+                name_table.append(name)
+            children.append(c)
+            parents.append(parent)
+            names.append(n)
+        parent += 1
+
+    # Now build the CSR arrays by counting the referrers of each node,
+    # turning the counts into offsets, and then dropping each edge
+    # into place.
+    #
+    offsets = array('l', [0]) * (len(nodes) + 1)
+    for c in children:
+        offsets[c + 1] += 1
+    for i in xrange(len(nodes)):
+        offsets[i + 1] += offsets[i]
+    fill = offsets[:-1]
+    csr_parents = array('l', [0]) * len(children)
+    csr_names = array('l', [0]) * len(children)
+    for k in xrange(len(children)):
+        c = children[k]
+        at = fill[c]
+        csr_parents[at] = parents[k]
+        csr_names[at] = names[k]
+        fill[c] = at + 1
+
+    if check:
+        # Every node's slice of the arrays should have been filled
+        # exactly, and every node other than a root should have been
+        # reached by some edge.
+        assert offsets[0] == 0, "offsets don't start at 0"
+        assert offsets[-1] == len(children), "offsets don't cover edges"
+        nroots = len(root_names)
+        for i in xrange(len(nodes)):
+            assert fill[i] == offsets[i + 1], "node {} not filled".format(i)
+            assert (i < nroots or offsets[i] < offsets[i + 1]), \
+                "node {} has no referrers".format(i)
+
+    return ReferrerIndex(nodes, node_ids, root_names,
+                         offsets, csr_parents, csr_names, name_table)